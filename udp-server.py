@@ -1,17 +1,137 @@
 import socket
+import selectors
+import ctypes
+import ctypes.util
+import errno
+import os
+import sys
 import logging
 from datetime import datetime
 import sqlite3
 from pathlib import Path
 import csv
 import json
-from collections import defaultdict
+import re
+import time
+import queue
+import threading
+
+
+# Packet framing: serial<sendVal channels>checksum, matched in a single pass.
+# Groups are serial, the sendVal command (if present), the channel list and
+# the checksum.
+_PACKET_RE = re.compile(rb'([^<]*)<\s*(sendVal)?([^>]*)>?(.*)', re.DOTALL)
+
+# Channel numbers are stored in an SQLite INTEGER column, a signed 64-bit value
+_MIN_CHANNEL = -(1 << 63)
+_MAX_CHANNEL = (1 << 63) - 1
+
+
+# Linux recvmmsg(2) structures, used to receive several datagrams per syscall
+class _Iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_Iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _Msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+_recvmmsg = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _recvmmsg = _libc.recvmmsg
+        _recvmmsg.argtypes = [
+            ctypes.c_int,
+            ctypes.POINTER(_Mmsghdr),
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_void_p,
+        ]
+        _recvmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _recvmmsg = None
+
+
+class MultiMessageReceiver:
+    """Receive up to vlen datagrams per recvmmsg(2) call into reusable buffers."""
+
+    def __init__(self, sock, vlen=32, buffer_size=1024):
+        self.sock = sock
+        self.vlen = vlen
+        self._buffers = (ctypes.c_char * buffer_size * vlen)()
+        self._iovecs = (_Iovec * vlen)()
+        self._msgs = (_Mmsghdr * vlen)()
+        for i in range(vlen):
+            self._iovecs[i].iov_base = ctypes.addressof(self._buffers[i])
+            self._iovecs[i].iov_len = buffer_size
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+
+    def receive(self):
+        """Return the datagrams currently queued on the socket, without blocking."""
+        count = _recvmmsg(self.sock.fileno(), self._msgs, self.vlen, socket.MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+        
+        # Copy each datagram out, as the buffers are overwritten by the next call
+        datagrams = []
+        for i in range(count):
+            msg = self._msgs[i]
+            if msg.msg_hdr.msg_flags & socket.MSG_TRUNC:
+                # A cut-off packet would be parsed as wrong values, so drop it
+                logging.getLogger(__name__).warning(
+                    "Dropping datagram longer than %d bytes, increase buffer_size", msg.msg_len
+                )
+                continue
+            datagrams.append(ctypes.string_at(self._iovecs[i].iov_base, msg.msg_len))
+        return datagrams
+
 
 class IoTUDPServer:
-    def __init__(self, host='0.0.0.0', port=56790, buffer_size=1024):
+    def __init__(self, host='0.0.0.0', port=56790, buffer_size=1024,
+                 batch_size=64, commit_interval=0.5,
+                 recv_buffer_size=8 << 20, recv_batch=32, write_queue_size=1024,
+                 csv_flush_interval=1.0, store_raw_packets=False, log_interval=1000,
+                 buffer_ttl=30.0):
         self.host = host
         self.port = port
         self.buffer_size = buffer_size
+        self.recv_buffer_size = recv_buffer_size
+        self.recv_batch = recv_batch
+        self.csv_flush_interval = csv_flush_interval
+        # Raw packet text is only kept in the database for debugging
+        self.store_raw_packets = store_raw_packets
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.log_interval = log_interval
+        self.buffer_ttl = buffer_ttl
+        
+        # Reusable receive buffer for the recvfrom_into fallback path; the spare
+        # byte shows when a datagram did not fit in buffer_size
+        self._rx_buf = bytearray(buffer_size + 1)
+        self._rx_view = memoryview(self._rx_buf)
         
         # Set up logging
         logging.basicConfig(
@@ -24,8 +144,18 @@ class IoTUDPServer:
         )
         self.logger = logging.getLogger(__name__)
         
-        # Buffer to store incomplete packet sets
-        self.packet_buffer = defaultdict(dict)
+        # Buffer to store incomplete packet sets, merged as packets arrive:
+        # serial -> (first_seen, channel_data, raw_packets).
+        # Insertion order is first-seen order, so the oldest set is always first.
+        self.packet_buffer = {}
+        
+        # Completed datasets handed from the receive loop to the writer thread
+        self.write_q = queue.Queue(maxsize=write_queue_size)
+        self.writer_thread = None
+        
+        # Rows waiting to be committed in the next batch
+        self._pending = []
+        self._last_commit = time.monotonic()
         
         # Initialize database
         self.db_path = Path('sensor_data.db')
@@ -34,173 +164,509 @@ class IoTUDPServer:
         # Ensure output directory exists
         self.output_dir = Path('output')
         self.output_dir.mkdir(exist_ok=True)
+        
+        # Open CSV files keyed by (serial, date):
+        # (file, channel order, channel set, file part number)
+        self._csv_cache = {}
+        self._last_csv_flush = time.monotonic()
+        self._datasets_written = 0
+
+    def configure_connection(self, conn):
+        """Apply write-ahead logging and relaxed sync pragmas to a connection."""
+        cursor = conn.cursor()
+        journal_mode = cursor.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")
+        return journal_mode
 
     def init_database(self):
-        """Initialize SQLite database for storing sensor data."""
+        """Open the long-lived SQLite connection and create the schema."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS sensor_readings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        serial_number TEXT,
-                        channel_data TEXT,
-                        raw_packets TEXT
-                    )
-                ''')
-                conn.commit()
-            self.logger.info(f"Database initialized at {self.db_path}")
+            self.conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            journal_mode = self.configure_connection(self.conn)
+            if journal_mode.lower() != 'wal':
+                self.logger.warning("Could not enable WAL mode, journal_mode is %s", journal_mode)
+            else:
+                self.logger.info("SQLite journal_mode set to WAL")
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sensor_readings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    serial_number TEXT,
+                    raw_packets TEXT
+                )
+            ''')
+            # One row per channel value, clustered by reading and channel
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sensor_values (
+                    reading_id INTEGER NOT NULL REFERENCES sensor_readings(id),
+                    channel INTEGER NOT NULL,
+                    value REAL,
+                    PRIMARY KEY (reading_id, channel)
+                ) WITHOUT ROWID
+            ''')
+            self._insert_stmt = '''
+                INSERT INTO sensor_readings (serial_number, raw_packets)
+                VALUES (?, ?)
+            '''
+            self._insert_values_stmt = '''
+                INSERT INTO sensor_values (reading_id, channel, value)
+                VALUES (?, ?, ?)
+            '''
+            self.logger.info("Database initialized at %s", self.db_path)
         except sqlite3.Error as e:
-            self.logger.error(f"Database initialization error: {e}")
+            self.logger.error("Database initialization error: %s", e)
             raise
 
     def parse_packet(self, packet_bytes):
-        """Parse a single UDP packet."""
+        """Parse a single UDP packet directly from its ASCII bytes."""
         try:
-            packet_str = packet_bytes.decode('utf-8')
-            
             # Extract basic components
-            serial = packet_str.split('<')[0]
-            content = packet_str.split('<')[1].split('>')[0]
-            checksum = packet_str.split('>')[-1]
+            match = _PACKET_RE.match(packet_bytes)
+            if match is None:
+                raise ValueError("missing '<' delimiter")
+            serial, command, channels_part, checksum = match.groups(b'')
+            channels_part = channels_part.strip()
             
-            # Parse channel data
+            # End marker carries no channel data, so skip the channel parse
+            if not channels_part:
+                return {
+                    'serial': serial.decode('ascii'),
+                    'channel_data': {},
+                    'checksum': checksum.decode('ascii'),
+                    'raw_packet': packet_bytes,
+                    'is_end_marker': True
+                }
+            
+            if not command:
+                raise ValueError("missing sendVal command")
+            
+            # Parse channel data in one pass, falling back to the per-channel
+            # checked parse only if some value is malformed
+            has_nan = b'NaN' in channels_part
             channel_data = {}
-            if 'sendVal' in content:
-                channels_part = content.replace('sendVal', '').strip()
-                if channels_part:  # If there's data after sendVal
-                    for channel in channels_part.split(';'):
-                        if '=' in channel:
-                            channel_num, value = channel.strip().split('=')
-                            try:
-                                # Handle NaN values
-                                if value.strip() == 'NaN':
-                                    channel_data[channel_num] = None
-                                else:
-                                    channel_data[channel_num] = float(value)
-                            except ValueError:
-                                self.logger.warning(f"Could not parse value for channel {channel_num}: {value}")
-                
+            try:
+                for channel in channels_part.split(b';'):
+                    channel_num, sep, value = channel.partition(b'=')
+                    if sep:
+                        # Handle NaN values
+                        if has_nan and value.strip() == b'NaN':
+                            channel_data[int(channel_num)] = None
+                        else:
+                            channel_data[int(channel_num)] = float(value)
+                # One range check for the whole packet; the checked path finds the culprit
+                if channel_data and (min(channel_data) < _MIN_CHANNEL or
+                                     max(channel_data) > _MAX_CHANNEL):
+                    raise ValueError("channel number out of range")
+            except ValueError:
+                channel_data = self.parse_channels_checked(channels_part)
+            
             return {
-                'serial': serial,
+                'serial': serial.decode('ascii'),
                 'channel_data': channel_data,
-                'checksum': checksum,
-                'raw_packet': packet_str,
-                'is_end_marker': bool(not channels_part.strip())
+                'checksum': checksum.decode('ascii'),
+                'raw_packet': packet_bytes,
+                'is_end_marker': False
             }
             
         except Exception as e:
-            self.logger.error(f"Error parsing packet: {e}")
+            self.logger.error("Error parsing packet: %s", e)
             return None
 
-    def save_to_database(self, serial, channel_data, raw_packets):
-        """Save complete dataset to SQLite database."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO sensor_readings (serial_number, channel_data, raw_packets)
-                    VALUES (?, ?, ?)
-                ''', (
-                    serial,
-                    json.dumps(channel_data),
-                    json.dumps(raw_packets)
+    def parse_channels_checked(self, channels_part):
+        """Parse channel data value by value, logging and skipping malformed channels."""
+        channel_data = {}
+        for channel in channels_part.split(b';'):
+            channel_num, sep, value = channel.strip().partition(b'=')
+            if sep:
+                try:
+                    number = int(channel_num)
+                    if not _MIN_CHANNEL <= number <= _MAX_CHANNEL:
+                        self.logger.warning(
+                            "Channel number out of range: %s",
+                            channel_num.decode(errors='replace')
+                        )
+                        continue
+                    # Handle NaN values
+                    if value.strip() == b'NaN':
+                        channel_data[number] = None
+                    else:
+                        channel_data[number] = float(value)
+                except ValueError:
+                    self.logger.warning(
+                        "Could not parse value for channel %s: %s",
+                        channel_num.decode(errors='replace'),
+                        value.decode(errors='replace')
+                    )
+        return channel_data
+
+    def save_to_database(self, serial, channel_data, raw_packets_json=None):
+        """Queue a complete dataset for the next batched database commit."""
+        self._pending.append((serial, channel_data, raw_packets_json))
+
+    def flush_database(self):
+        """Commit all pending datasets to SQLite in a single transaction."""
+        if self._pending:
+            try:
+                cursor = self.conn.cursor()
+                # IMMEDIATE takes the write lock up front, so the readings inserted
+                # below get consecutive ids ending at last_insert_rowid()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.executemany(self._insert_stmt, (
+                    (serial, raw_packets_json)
+                    for serial, _, raw_packets_json in self._pending
                 ))
-                conn.commit()
-        except sqlite3.Error as e:
-            self.logger.error(f"Database error while saving data: {e}")
+                last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+                first_id = last_id - len(self._pending) + 1
+                
+                values = []
+                for reading_id, (_, channel_data, _) in enumerate(self._pending, first_id):
+                    values.extend(
+                        (reading_id, channel, value)
+                        for channel, value in channel_data.items()
+                    )
+                cursor.executemany(self._insert_values_stmt, values)
+                cursor.execute("COMMIT")
+            except Exception as e:
+                # Any failure, not only sqlite3.Error, must not leave the transaction open
+                self.logger.error("Database error while saving data: %s", e)
+                if self.conn.in_transaction:
+                    try:
+                        self.conn.execute("ROLLBACK")
+                    except sqlite3.Error as e:
+                        self.logger.error("Database error during rollback: %s", e)
+            finally:
+                self._pending.clear()
+        self._last_commit = time.monotonic()
+
+    def csv_filename(self, serial, date_str, part):
+        """Return the path of a device's daily CSV file; later parts get a numeric suffix."""
+        if part == 0:
+            return self.output_dir / f"sensor_data_{serial}_{date_str}.csv"
+        return self.output_dir / f"sensor_data_{serial}_{date_str}_{part}.csv"
+
+    def get_csv_file(self, serial, date_str, channel_data):
+        """Return the cached (file, channels, channel set, part) entry whose header covers channel_data."""
+        key = (serial, date_str)
+        entry = self._csv_cache.get(key)
+        if entry is not None:
+            if channel_data.keys() <= entry[2]:
+                return entry
+            
+            # New channels appeared: roll over to a file whose header includes them
+            csvfile, channels, _, part = self._csv_cache.pop(key)
+            self.close_csv_file(csvfile)
+            return self.open_next_csv_file(serial, date_str, part, channels, channel_data)
+        
+        # Close the previous day's file for this device
+        for old_key in [k for k in self._csv_cache if k[0] == serial]:
+            self.close_csv_file(self._csv_cache.pop(old_key)[0])
+        
+        # Continue the latest file written today, e.g. after a restart
+        part = 0
+        while self.csv_filename(serial, date_str, part + 1).exists():
+            part += 1
+        
+        try:
+            channels = self.read_csv_channels(self.csv_filename(serial, date_str, part))
+        except ValueError as e:
+            self.logger.warning("%s, starting a new CSV file", e)
+            return self.open_next_csv_file(serial, date_str, part, (), channel_data)
+        
+        # Create header row if file is new
+        if channels is None:
+            return self.open_csv_file(serial, date_str, part, channel_data, write_header=True)
+        
+        if channel_data.keys() <= set(channels):
+            return self.open_csv_file(serial, date_str, part, channels, write_header=False)
+        
+        return self.open_next_csv_file(serial, date_str, part, channels, channel_data)
 
-    def write_to_csv(self, serial, channel_data):
+    def open_next_csv_file(self, serial, date_str, part, channels, channel_data):
+        """Start the next free CSV file part with the union of the old and new channels."""
+        part += 1
+        while self.csv_filename(serial, date_str, part).exists():
+            part += 1
+        
+        entry = self.open_csv_file(
+            serial, date_str, part, set(channels) | channel_data.keys(), write_header=True
+        )
+        self.logger.info(
+            "New channels from %s, continuing in CSV file %s", serial, entry[0].name
+        )
+        return entry
+
+    def open_csv_file(self, serial, date_str, part, channels, write_header):
+        """Open a CSV file for appending, writing its header if needed, and cache it."""
+        csvfile = open(self.csv_filename(serial, date_str, part), 'a', newline='', buffering=65536)
+        
+        if write_header:
+            # Get all channel numbers sorted numerically, reused for every row
+            channels = tuple(sorted(channels))
+            # Create headers: timestamp + channel numbers
+            headers = ['Timestamp'] + [f'Channel_{ch}' for ch in channels]
+            csv.writer(csvfile).writerow(headers)
+        
+        entry = (csvfile, channels, frozenset(channels), part)
+        self._csv_cache[(serial, date_str)] = entry
+        return entry
+
+    def read_csv_channels(self, filename):
+        """Return the channel order from an existing CSV file's header, or None if there is none."""
+        try:
+            with open(filename, newline='') as csvfile:
+                headers = next(csv.reader(csvfile), None)
+        except FileNotFoundError:
+            return None
+        
+        if not headers:
+            return None
+        
+        try:
+            return tuple(int(header.removeprefix('Channel_')) for header in headers[1:])
+        except ValueError:
+            raise ValueError(f"Unrecognised CSV header in {filename}")
+
+    def flush_csv_files(self):
+        """Flush buffered rows of all open CSV files to disk."""
+        for csvfile, *_ in self._csv_cache.values():
+            try:
+                csvfile.flush()
+            except OSError as e:
+                self.logger.error("Error flushing CSV file %s: %s", csvfile.name, e)
+        self._last_csv_flush = time.monotonic()
+
+    def close_csv_file(self, csvfile):
+        """Close a CSV file, logging any error from writing its buffered rows."""
+        try:
+            csvfile.close()
+        except OSError as e:
+            self.logger.error("Error closing CSV file %s: %s", csvfile.name, e)
+
+    def close_csv_files(self):
+        """Close all cached CSV files."""
+        for csvfile, *_ in self._csv_cache.values():
+            self.close_csv_file(csvfile)
+        self._csv_cache.clear()
+
+    def write_to_csv(self, serial, channel_data, timestamp=None):
         """Write the complete dataset to a CSV file with timestamp and horizontal channel layout."""
-        timestamp = datetime.now()
+        if timestamp is None:
+            timestamp = datetime.now()
         date_str = timestamp.strftime("%Y%m%d")
-        filename = self.output_dir / f"sensor_data_{serial}_{date_str}.csv"
         
         try:
-            # Determine if file exists to handle headers
-            file_exists = filename.exists()
+            csvfile, channels, _, _ = self.get_csv_file(serial, date_str, channel_data)
             
-            with open(filename, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                
-                # Create header row if file is new
-                if not file_exists:
-                    # Get all channel numbers sorted numerically
-                    channels = sorted(int(k) for k in channel_data.keys())
-                    # Create headers: timestamp + channel numbers
-                    headers = ['Timestamp'] + [f'Channel_{ch}' for ch in channels]
-                    writer.writerow(headers)
-                
-                # Create data row
-                # First column is timestamp
-                row_data = [timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]]
-                
-                # Add channel values in order
-                for ch in sorted(int(k) for k in channel_data.keys()):
-                    value = channel_data[str(ch)]
-                    row_data.append(value if value is not None else 'NaN')
-                
-                writer.writerow(row_data)
+            # Values are numeric and never need quoting, so format the row directly,
+            # keeping the csv module's repr() floats and \r\n line endings
+            row_data = [timestamp.isoformat(sep=' ', timespec='milliseconds')]
+            row_data.extend(
+                'NaN' if value is None else repr(value)
+                for value in map(channel_data.get, channels)
+            )
+            csvfile.write(','.join(row_data) + '\r\n')
             
-            self.logger.info(f"Data appended to CSV file: {filename}")
+            # Per-dataset logging is debug only; progress is summarised every log_interval datasets
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Data appended to CSV file: %s", csvfile.name)
+            self._datasets_written += 1
+            if self._datasets_written % self.log_interval == 0:
+                self.logger.info("%d datasets written to CSV", self._datasets_written)
             
         except Exception as e:
-            self.logger.error(f"Error writing CSV file: {e}")
+            self.logger.error("Error writing CSV file: %s", e)
 
     def process_complete_dataset(self, serial):
-        """Process a complete set of packets for a device."""
+        """Hand a complete set of packets for a device to the writer thread."""
         try:
-            # Combine all channel data
-            combined_channel_data = {}
-            raw_packets = []
+            # Take the merged packet set out of the buffer for this device
+            _, combined_channel_data, raw_packets = self.packet_buffer.pop(serial)
             
-            for packet_info in self.packet_buffer[serial].values():
-                combined_channel_data.update(packet_info['channel_data'])
-                raw_packets.append(packet_info['raw_packet'])
+            # Serialize raw packets once, compactly, only when they are kept
+            raw_packets_json = None
+            if self.store_raw_packets:
+                raw_packets_json = json.dumps(
+                    [packet.decode('utf-8', errors='replace') for packet in raw_packets],
+                    separators=(',', ':')
+                )
             
-            # Save to database
-            self.save_to_database(serial, combined_channel_data, raw_packets)
+            try:
+                self.write_q.put_nowait((
+                    serial,
+                    combined_channel_data,
+                    raw_packets_json,
+                    datetime.now()
+                ))
+            except queue.Full:
+                self.logger.error("Write queue full, dropping dataset from %s", serial)
             
-            # Write to CSV
-            self.write_to_csv(serial, combined_channel_data)
+        except Exception as e:
+            self.logger.error("Error processing complete dataset: %s", e)
+
+    def persist_dataset(self, item):
+        """Save a complete dataset to the database batch and its CSV file."""
+        serial, channel_data, raw_packets_json, timestamp = item
+        
+        # Save to database
+        self.save_to_database(serial, channel_data, raw_packets_json)
+        
+        # Write to CSV
+        self.write_to_csv(serial, channel_data, timestamp)
+
+    def writer_loop(self):
+        """Persist queued datasets and commit them in batches until stopped."""
+        while True:
+            try:
+                item = self.write_q.get(timeout=self.commit_interval)
+            except queue.Empty:
+                item = False
             
-            # Clear the buffer for this device
-            del self.packet_buffer[serial]
+            if item is None:
+                break
             
+            # Nothing may end this thread, or every later dataset would be dropped
+            try:
+                if item:
+                    self.persist_dataset(item)
+                
+                if (len(self._pending) >= self.batch_size or
+                        time.monotonic() - self._last_commit > self.commit_interval):
+                    self.flush_database()
+                
+                if time.monotonic() - self._last_csv_flush > self.csv_flush_interval:
+                    self.flush_csv_files()
+            except Exception as e:
+                self.logger.error("Error in writer thread: %s", e)
+        
+        try:
+            self.flush_database()
         except Exception as e:
-            self.logger.error(f"Error processing complete dataset: {e}")
+            self.logger.error("Error in writer thread: %s", e)
+        self.close_csv_files()
+
+    def handle_packet(self, data):
+        """Parse a datagram and add it to its device's packet set."""
+        parsed = self.parse_packet(data)
+        
+        if parsed:
+            serial = parsed['serial']
+            
+            # A set older than buffer_ttl lost its end marker; never merge into it
+            entry = self.packet_buffer.get(serial)
+            if entry is not None and time.monotonic() - entry[0] > self.buffer_ttl:
+                self.drop_packet_set(serial)
+                entry = None
+            
+            if parsed['is_end_marker']:
+                # End marker received, process the complete dataset
+                if entry is not None:
+                    self.process_complete_dataset(serial)
+            else:
+                # Merge the packet data into the device's packet set
+                if entry is None:
+                    self.evict_stale_buffers()
+                    entry = self.packet_buffer[serial] = (time.monotonic(), {}, [])
+                entry[1].update(parsed['channel_data'])
+                if self.store_raw_packets:
+                    entry[2].append(parsed['raw_packet'])
+
+    def drop_packet_set(self, serial):
+        """Discard a device's incomplete packet set that timed out."""
+        _, channel_data, _ = self.packet_buffer.pop(serial)
+        self.logger.warning(
+            "Dropping incomplete packet set from %s (%d channels, no end marker after %gs)",
+            serial, len(channel_data), self.buffer_ttl
+        )
+
+    def evict_stale_buffers(self):
+        """Drop packet sets whose end marker has not arrived within buffer_ttl seconds."""
+        cutoff = time.monotonic() - self.buffer_ttl
+        while self.packet_buffer:
+            serial = next(iter(self.packet_buffer))
+            if self.packet_buffer[serial][0] > cutoff:
+                break
+            self.drop_packet_set(serial)
+
+    def receive_datagrams(self, sock, receiver):
+        """Drain up to recv_batch datagrams from the non-blocking socket."""
+        if receiver is not None:
+            return receiver.receive()
+        
+        datagrams = []
+        for _ in range(self.recv_batch):
+            try:
+                nbytes, addr = sock.recvfrom_into(self._rx_buf, self.buffer_size + 1)
+            except BlockingIOError:
+                break
+            if nbytes > self.buffer_size:
+                self.logger.warning(
+                    "Dropping datagram longer than %d bytes, increase buffer_size", self.buffer_size
+                )
+                continue
+            # Copy out the received bytes, as the buffer is reused for the next datagram
+            datagrams.append(bytes(self._rx_view[:nbytes]))
+        return datagrams
 
     def start(self):
         """Start the UDP server and listen for incoming data."""
-        self.logger.info(f"Starting UDP server on {self.host}:{self.port}")
+        self.logger.info("Starting UDP server on %s:%s", self.host, self.port)
         self.logger.info("Waiting for data... Press Ctrl+C to stop.")
         
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.bind((self.host, self.port))
+        # A large kernel buffer absorbs bursts while the database is committing
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+        self.logger.info(
+            "Socket receive buffer: %d bytes",
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        )
+        sock.setblocking(False)
+        
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        
+        # Use recvmmsg where available, otherwise fall back to recvfrom
+        receiver = None
+        if _recvmmsg is not None:
+            receiver = MultiMessageReceiver(
+                sock,
+                vlen=self.recv_batch,
+                buffer_size=self.buffer_size
+            )
+        
+        # Database and CSV writes happen off the receive loop
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
         
         try:
             while True:
-                data, addr = sock.recvfrom(self.buffer_size)
-                parsed = self.parse_packet(data)
-                
-                if parsed:
-                    serial = parsed['serial']
-                    
-                    if parsed['is_end_marker']:
-                        # End marker received, process the complete dataset
-                        if serial in self.packet_buffer:
-                            self.process_complete_dataset(serial)
-                    else:
-                        # Store the packet data
-                        self.packet_buffer[serial][len(self.packet_buffer[serial])] = parsed
+                if selector.select():
+                    for data in self.receive_datagrams(sock, receiver):
+                        self.handle_packet(data)
                 
         except KeyboardInterrupt:
             self.logger.info("\nServer shutdown requested")
         except Exception as e:
-            self.logger.error(f"Unexpected error: {e}")
+            self.logger.error("Unexpected error: %s", e)
         finally:
+            selector.close()
             sock.close()
+            # Only wait for the writer if it is still running to take the sentinel
+            if self.writer_thread.is_alive():
+                try:
+                    self.write_q.put(None, timeout=5)
+                except queue.Full:
+                    self.logger.error("Write queue full at shutdown, pending datasets lost")
+                self.writer_thread.join(timeout=10)
+            if self.writer_thread.is_alive():
+                self.logger.error("Writer thread did not stop, closing database anyway")
+            self.conn.close()
             self.logger.info("Server shutdown complete")
 
 if __name__ == "__main__":